@@ -1,39 +1,118 @@
+import codecs
 import io
 import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple
 
-import chardet
-import docx2txt
+import fitz  # PyMuPDF
 import pdfplumber
+from charset_normalizer import from_bytes
+from docx import Document
 
 SUPPORTED = {".txt", ".pdf", ".docx"}
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+DETECT_SAMPLE_THRESHOLD = 256 * 1024  # above this, detect on a head sample only
+DETECT_SAMPLE_BYTES = 64 * 1024
+# Kannada uploads are UTF-8; English ones are UTF-8, cp1252 or latin-1.
+TXT_CANDIDATE_ENCODINGS = ["utf_8", "ascii", "cp1252", "latin_1", "utf_16"]
+MIN_DETECT_CONFIDENCE = 0.5
 
 def _ext(name: str) -> str:
     return os.path.splitext(name or "")[1].lower()
 
+def _looks_utf8(raw: bytes) -> bool:
+    if raw.startswith(codecs.BOM_UTF8):
+        return True
+    try:
+        # Incremental decode tolerates a multi-byte char cut at the 1KB boundary.
+        codecs.getincrementaldecoder("utf-8")().decode(raw[:1024], final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
 def _read_txt(stream: io.BufferedReader) -> str:
     raw = stream.read()
+    if _looks_utf8(raw):
+        return raw.decode("utf-8-sig", errors="replace")
     # Try to detect encoding; default utf-8
-    enc = chardet.detect(raw).get("encoding") or "utf-8"
+    sample = raw[:DETECT_SAMPLE_BYTES] if len(raw) > DETECT_SAMPLE_THRESHOLD else raw
+    best = from_bytes(sample, cp_isolation=TXT_CANDIDATE_ENCODINGS).best()
+    if best is None or 1.0 - best.chaos < MIN_DETECT_CONFIDENCE:
+        return raw.decode("utf-8", errors="replace")
+    enc = best.encoding
     try:
         return raw.decode(enc, errors="replace")
     except Exception:
         return raw.decode("utf-8", errors="replace")
 
-def _read_pdf(stream: io.BufferedReader) -> str:
-    text_parts = []
-    with pdfplumber.open(stream) as pdf:
-        for page in pdf.pages:
-            text_parts.append(page.extract_text() or "")
-    return "\n".join(text_parts).strip()
+def _fitz_page_text(pdf_bytes: bytes, index: int) -> str:
+    # Runs in a worker process: reopen the PDF there instead of pickling pages.
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc[index].get_text("text") or ""
+
+def _plumber_text(page) -> str:
+    # Skip image-only pages and pdfplumber's layout reconstruction; similarity
+    # only needs the token stream.
+    if not page.chars:
+        return ""
+    return page.extract_text(x_tolerance=3, y_tolerance=3, layout=False) or ""
+
+def _plumber_page_text(pdf_bytes: bytes, index: int) -> str:
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return _plumber_text(pdf.pages[index])
+
+def _map_pages(page_fn, pdf_bytes: bytes, n_pages: int) -> str:
+    with ProcessPoolExecutor(max_workers=min(PDF_WORKERS, n_pages)) as pool:
+        # map() yields results in page order.
+        text_parts = pool.map(page_fn, [pdf_bytes] * n_pages, range(n_pages))
+        return "\n".join(text_parts).strip()
+
+def _read_pdf_fitz(pdf_bytes: bytes) -> str:
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        n_pages = doc.page_count
+        if n_pages <= 1 or PDF_WORKERS <= 1:
+            return "\n".join(page.get_text("text") or "" for page in doc).strip()
+    return _map_pages(_fitz_page_text, pdf_bytes, n_pages)
+
+def _read_pdf_plumber(pdf_bytes: bytes) -> str:
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        n_pages = len(pdf.pages)
+        if n_pages <= 1 or PDF_WORKERS <= 1:
+            return "\n".join(_plumber_text(page) for page in pdf.pages).strip()
+    return _map_pages(_plumber_page_text, pdf_bytes, n_pages)
+
+def _read_pdf(pdf_bytes: bytes) -> str:
+    # PyMuPDF is much faster; pdfplumber stays as a fallback for files MuPDF rejects.
+    try:
+        return _read_pdf_fitz(pdf_bytes)
+    except Exception:
+        return _read_pdf_plumber(pdf_bytes)
 
 def _read_docx(stream: io.BufferedReader) -> str:
-    # docx2txt expects a path; but it can also take file-like via NamedTemporaryFile.
-    import tempfile
-    with tempfile.NamedTemporaryFile(suffix=".docx") as tmp:
-        tmp.write(stream.read())
-        tmp.flush()
-        return docx2txt.process(tmp.name) or ""
+    # Only paragraph text matters for similarity; python-docx reads straight
+    # from the in-memory stream, no temp file on disk.
+    doc = Document(stream)
+    return "\n".join(p.text for p in doc.paragraphs if p.text)
+
+def _unsupported(ext: str) -> ValueError:
+    return ValueError(f"Unsupported file type '{ext}'. Supported: {', '.join(sorted(SUPPORTED))}")
+
+def check_upload(stream, filename: str) -> str:
+    """
+    Cheap pre-read validation: extension plus a magic-byte sniff of the head.
+    Rewinds the stream. Returns the extension; raises ValueError on mismatch.
+    """
+    ext = _ext(filename)
+    if ext not in SUPPORTED:
+        raise _unsupported(ext)
+    head = stream.read(1024)
+    stream.seek(0)
+    # PDF readers tolerate leading junk before the header, so search the head.
+    if ext == ".pdf" and b"%PDF-" not in head:
+        raise ValueError(f"'{filename}' is not a valid PDF file.")
+    if ext == ".docx" and not head.startswith(b"PK\x03\x04"):
+        raise ValueError(f"'{filename}' is not a valid .docx file.")
+    return ext
 
 def extract_text_from_stream(stream, filename: str) -> Tuple[str, str]:
     """
@@ -42,18 +121,22 @@ def extract_text_from_stream(stream, filename: str) -> Tuple[str, str]:
     """
     ext = _ext(filename)
     if ext not in SUPPORTED:
-        raise ValueError(f"Unsupported file type '{ext}'. Supported: {', '.join(sorted(SUPPORTED))}")
-    buf = io.BytesIO(stream.read())
-    buf.seek(0)
-
+        raise _unsupported(ext)
+    # Parsers read the upload stream directly; no intermediate BytesIO copy.
+    if hasattr(stream, "seek"):
+        stream.seek(0)
     if ext == ".txt":
-        txt = _read_txt(buf)
+        txt = _read_txt(stream)
         return txt, "text"
     if ext == ".pdf":
-        txt = _read_pdf(buf)
+        txt = _read_pdf(stream.read())
         return txt, "pdf"
     if ext == ".docx":
-        txt = _read_docx(buf)
+        txt = _read_docx(stream)
         return txt, "docx"
     # (Legacy .doc not supported reliably on Render. Convert to .docx before upload.)
     raise ValueError("Unsupported file type.")
+
+def extract_text_from_stream_bytes(raw: bytes, filename: str) -> Tuple[str, str]:
+    """Picklable entry point for running extraction in a worker process."""
+    return extract_text_from_stream(io.BytesIO(raw), filename)
@@ -1,5 +1,11 @@
+import hashlib
+import random
+import threading
 import time
-from typing import Optional
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import httpx
 from gradio_client import Client
 
 class GradioSpaceError(Exception):
@@ -8,43 +14,103 @@ class GradioSpaceError(Exception):
         self.message = message
         self.detail = detail
 
+def _is_retryable(err: Exception) -> bool:
+    """Only transport failures, 429 and 5xx responses can succeed on retry."""
+    if isinstance(err, httpx.TransportError):
+        return True
+    if isinstance(err, httpx.HTTPStatusError):
+        status = err.response.status_code
+        return status == 429 or status >= 500
+    return False
+
 class SimilarityClient:
     def __init__(self, space_url: str, api_name: str = "/_on_click",
-                 timeout_s: int = 30, retries: int = 3, backoff_s: float = 2.0):
+                 timeout_s: int = 30, retries: int = 3, backoff_s: float = 2.0,
+                 cache_size: int = 2048, health_ttl_s: float = 30.0):
         self.space_url = space_url
         self.api_name = api_name
         self.timeout_s = timeout_s
         self.retries = retries
         self.backoff_s = backoff_s
         self._client = None
+        self._client_lock = threading.Lock()
+        self.health_ttl_s = health_ttl_s
+        self._api_info = None
+        self._api_info_ts: Optional[float] = None
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _sleep_backoff(self, attempt: int):
+        # Full jitter: desynchronizes retries from concurrent workers.
+        time.sleep(random.uniform(0, min(self.backoff_s * (2 ** attempt), 30.0)))
 
     def _initialize_client(self):
         """Attempt to initialize the Gradio client with retries."""
         last_err = None
         for attempt in range(self.retries + 1):
             try:
-                client = Client(self.space_url)
+                client = Client(self.space_url, httpx_kwargs={
+                    "http2": True,
+                    "limits": httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+                })
                 # Confirm API info exists
-                _ = client.view_api(self.api_name)
+                self._api_info = client.view_api(self.api_name)
                 self._client = client
                 return
             except Exception as e:
                 last_err = e
-                time.sleep(self.backoff_s * (attempt + 1))
+                if attempt < self.retries:
+                    self._sleep_backoff(attempt)
         raise GradioSpaceError("Failed to initialize Gradio client after retries", detail=str(last_err))
 
     def _ensure_client(self):
         if self._client is None:
-            self._initialize_client()
+            # Concurrent requests must not race to build separate clients.
+            with self._client_lock:
+                if self._client is None:
+                    self._initialize_client()
 
     def healthcheck(self) -> bool:
+        """Report upstream health, probing the Space at most once per health_ttl_s."""
+        now = time.monotonic()
+        if self._api_info_ts is not None and now - self._api_info_ts < self.health_ttl_s:
+            return self._client is not None
         try:
             self._ensure_client()
             return True
         except GradioSpaceError:
             return False
+        finally:
+            self._api_info_ts = now
+
+    @staticmethod
+    def _cache_key(lang: str, text1: str, text2: str) -> Tuple[str, str, str]:
+        # Key on short digests so the cache doesn't hold full texts.
+        h1 = hashlib.blake2b(text1.encode("utf-8"), digest_size=16).hexdigest()
+        h2 = hashlib.blake2b(text2.encode("utf-8"), digest_size=16).hexdigest()
+        return lang, h1, h2
+
+    def compare(self, lang: str, text1: str, text2: str, use_cache: bool = True) -> float:
+        """LRU-cached wrapper around the Space call; use_cache=False always calls out."""
+        if not use_cache or self.cache_size <= 0:
+            return self._compare_remote(lang, text1, text2)
+
+        key = self._cache_key(lang, text1, text2)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        similarity = self._compare_remote(lang, text1, text2)
+        with self._cache_lock:
+            self._cache[key] = similarity
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return similarity
 
-    def compare(self, lang: str, text1: str, text2: str) -> float:
+    def _compare_remote(self, lang: str, text1: str, text2: str) -> float:
         self._ensure_client()
         last_err = None
         for attempt in range(self.retries + 1):
@@ -58,8 +124,13 @@ class SimilarityClient:
                 if isinstance(result, (float, int)):
                     return float(result)
                 raise GradioSpaceError("Unexpected return format", detail=str(result))
+            except GradioSpaceError:
+                raise
             except Exception as e:
+                if not _is_retryable(e):
+                    raise GradioSpaceError("Space call failed", detail=str(e))
                 last_err = e
-                time.sleep(self.backoff_s * (attempt + 1)) if attempt < self.retries else None
+                if attempt < self.retries:
+                    self._sleep_backoff(attempt)
 
         raise GradioSpaceError("Failed after retries", detail=str(last_err))
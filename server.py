@@ -1,11 +1,16 @@
+import functools
 import os
-import re
-from typing import Optional
-from flask import Flask, request, jsonify
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from tempfile import SpooledTemporaryFile
+from typing import Any, Optional
+
+import orjson
+from flask import Flask, Request, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
-from extractor import extract_text_from_stream
+from extractor import check_upload, extract_text_from_stream_bytes
 from hf_client import SimilarityClient, GradioSpaceError
 
 # ---- Config (via env or defaults) -------------------------------------------
@@ -14,27 +19,62 @@ API_NAME = os.getenv("SPACE_API_NAME", "/_on_click")  # from your current Space
 REQUEST_MAX_MB = float(os.getenv("REQUEST_MAX_MB", "20"))
 MAX_TEXT_CHARS = int(os.getenv("MAX_TEXT_CHARS", "20000"))  # post-trim cap
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*")  # e.g., "https://your-webapp.example"
+UPLOAD_SPOOL_BYTES = 1 * 1024 * 1024  # uploads above this spill to disk
+EXTRACT_TIMEOUT_S = float(os.getenv("EXTRACT_TIMEOUT_S", "30"))
 # -----------------------------------------------------------------------------
 
+class ORJSONProvider(JSONProvider):
+    """Route request.get_json() and jsonify() through orjson."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+class SpoolingRequest(Request):
+    """Keep uploads in memory up to 1MB, then spill to disk, bounding RSS."""
+    max_form_memory_size = UPLOAD_SPOOL_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode="rb+")
+
 app = Flask(__name__)
+app.request_class = SpoolingRequest
+app.json = ORJSONProvider(app)
 app.config['MAX_CONTENT_LENGTH'] = int(REQUEST_MAX_MB * 1024 * 1024)
 CORS(app, resources={r"/*": {"origins": ALLOWED_ORIGINS}})
 
-# Lazy client initialization
-_sim_client = None
-
+# Lazy client initialization; lru_cache memoizes the single instance thread-safely.
+@functools.lru_cache(maxsize=1)
 def get_client() -> SimilarityClient:
-    global _sim_client
-    if _sim_client is None:
-        _sim_client = SimilarityClient(space_url=SPACE_URL, api_name=API_NAME)
-    return _sim_client
+    return SimilarityClient(space_url=SPACE_URL, api_name=API_NAME)
+
+# File parsing is CPU-bound; run it in worker processes off the request thread.
+# Created lazily so gunicorn workers don't inherit a pool from the master.
+@functools.lru_cache(maxsize=1)
+def get_extract_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
 
 LANG_SET = {"kannada", "english"}
 
 def _clean_text(s: str) -> str:
-    s = re.sub(r'\s+', ' ', s or '').strip()
+    # Truncate *before* normalizing so huge extractions aren't scanned in full;
+    # the 4x head budget leaves room for whitespace runs that collapse away.
+    s = (s or "")[:MAX_TEXT_CHARS * 4]
+    # str.split() collapses all Unicode whitespace runs in C, same as re's \s+.
+    s = " ".join(s.split())
     return s[:MAX_TEXT_CHARS] if len(s) > MAX_TEXT_CHARS else s
 
+def _use_cache() -> bool:
+    # ?cache=false bypasses the similarity cache.
+    return request.args.get("cache", "true").strip().lower() not in {"0", "false", "no"}
+
 def _validate_lang(lang: str) -> str:
     if not lang:
         raise ValueError("Missing 'lang'. Valid values: 'kannada' or 'english'.")
@@ -90,8 +130,11 @@ def compare_text():
         return jsonify(error=str(e)), 400
 
     try:
-        client = get_client()
-        similarity = client.compare(lang_for_space, text1, text2)
+        if text1 == text2:
+            similarity = 1.0  # identical after cleaning; skip the Space call
+        else:
+            client = get_client()
+            similarity = client.compare(lang_for_space, text1, text2, use_cache=_use_cache())
         return jsonify({
             "ok": True,
             "lang": lang_for_space,
@@ -112,7 +155,6 @@ def compare_file():
       file             : uploaded file (.txt, .pdf, .docx)
     """
     lang = request.form.get("lang", "")
-    transcript_text = _clean_text(request.form.get("transcript_text", ""))
 
     if "file" not in request.files:
         return jsonify(error="Missing 'file' field."), 400
@@ -122,17 +164,37 @@ def compare_file():
     if not filename:
         return jsonify(error="Invalid file name."), 400
 
+    # Reject bad uploads before reading the body into memory.
+    if uploaded.content_length and uploaded.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify(error=f"File exceeds the {REQUEST_MAX_MB:g} MB upload limit."), 413
     try:
-        file_text, detected_type = extract_text_from_stream(uploaded.stream, filename)
+        check_upload(uploaded.stream, filename)
     except ValueError as e:
         return jsonify(error=str(e)), 415
+
+    try:
+        future = get_extract_pool().submit(extract_text_from_stream_bytes, uploaded.stream.read(), filename)
     except Exception as e:
         return jsonify(error="Failed to extract text from file.", detail=str(e)), 500
 
-    file_text = _clean_text(file_text)
-
+    # Clean the transcript while the worker process parses the file.
+    transcript_text = _clean_text(request.form.get("transcript_text", ""))
     if not transcript_text:
+        future.cancel()
         return jsonify(error="Missing or empty 'transcript_text'."), 400
+
+    try:
+        file_text, detected_type = future.result(timeout=EXTRACT_TIMEOUT_S)
+    except ValueError as e:
+        return jsonify(error=str(e)), 415
+    except FutureTimeoutError:
+        future.cancel()
+        return jsonify(error=f"Timed out extracting text from '{filename}'."), 504
+    except Exception as e:
+        return jsonify(error="Failed to extract text from file.", detail=str(e)), 500
+
+    file_text = _clean_text(file_text)
+
     if not file_text:
         return jsonify(error=f"No extractable text found in '{filename}'. Ensure it is a text/PDF/Docx."), 422
 
@@ -142,8 +204,11 @@ def compare_file():
         return jsonify(error=str(e)), 400
 
     try:
-        client = get_client()
-        similarity = client.compare(lang_for_space, transcript_text, file_text)
+        if transcript_text == file_text:
+            similarity = 1.0  # identical after cleaning; skip the Space call
+        else:
+            client = get_client()
+            similarity = client.compare(lang_for_space, transcript_text, file_text, use_cache=_use_cache())
         return jsonify({
             "ok": True,
             "lang": lang_for_space,